@@ -0,0 +1,90 @@
+'''
+Running step work in an executor with completion handled on the thread which
+submitted it, independent of Zinc, PySide and MAP Client.
+'''
+from os.path import join, isdir
+from os import mkdir
+from concurrent.futures import Future, ThreadPoolExecutor
+
+def submitstepwork(executor, dispatch, work, args, finish):
+    '''
+    Submit work(*args) to executor. When it has completed, finish(result) is
+    called on the submitting thread by passing it to dispatch, so step state is
+    never changed from a worker thread.
+    :param executor: concurrent.futures executor. For a process pool, work and
+    args must be picklable.
+    :param dispatch: Callable dispatch(function, *args) which schedules
+    function(*args) on the submitting thread's event loop, e.g.
+    asyncio loop.call_soon_threadsafe or a queued Qt signal.
+    :param work: Callable run in executor.
+    :param args: Tuple of arguments for work.
+    :param finish: Callable taking the result of work, called on the submitting thread.
+    :return: concurrent.futures.Future resolved on the submitting thread with the
+    return value of finish once it has returned, or with the exception raised
+    by work or finish.
+    '''
+    done = Future()
+
+    def complete(workFuture):
+        exception = workFuture.exception()
+        if exception is not None:
+            done.set_exception(exception)
+            return
+        try:
+            result = finish(workFuture.result())
+        except Exception as e:
+            done.set_exception(e)
+            return
+        done.set_result(result)
+
+    executor.submit(work, *args).add_done_callback(lambda workFuture: dispatch(complete, workFuture))
+    return done
+
+class AsyncFileStepMixin(object):
+    '''
+    Adds executeAsync() to a workflow step whose execution writes a single
+    output file and provides its location on port 0. The step class sets
+    _writeFile to staticmethod(write), where write(filenameOut, config) is a
+    module level function, and _outputFilename to the output file name, and
+    has _location, _config, _portData0, getIdentifier() and _doneExecution()
+    as the workflow step mount point does. For default dispatch it also has
+    _dispatcher, an object with a dispatch() method suitable for submitstepwork.
+    '''
+
+    def executeAsync(self, executor=None, dispatch=None):
+        '''
+        Alternative to execute() for workflow runners which overlap independent
+        steps. Writing the output file is submitted to executor, or to a new
+        single worker thread if none is given. Once the file is written the
+        port data is set and _doneExecution() is called on the calling thread
+        via dispatch, which defaults to _dispatcher.dispatch.
+        Returns a concurrent.futures.Future which gives the output file location
+        after _doneExecution() has returned, or the exception raised by writing.
+        '''
+        filenameOut = self._makeOutputFilename()
+
+        def writeFinished(result):
+            self._portData0 = filenameOut
+            self._doneExecution()
+            return filenameOut
+
+        ownExecutor = executor is None
+        if ownExecutor:
+            executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            # pass a copy of the config so later edits do not affect the running write
+            return submitstepwork(executor, dispatch or self._dispatcher.dispatch, self._writeFile,
+                (filenameOut, dict(self._config)), writeFinished)
+        finally:
+            if ownExecutor:
+                executor.shutdown(wait=False)
+
+    def _makeOutputFilename(self):
+        '''
+        Create the output directory for this step if needed.
+        Returns the name of the file to write.
+        '''
+        output_dir = join(self._location, self.getIdentifier() + '_output')
+        if not isdir(output_dir):
+            mkdir(output_dir)
+        return join(output_dir, self._outputFilename)
@@ -2,12 +2,18 @@
 
 from PySide import QtGui
 from mapclientplugins.createhemispheremodelstep.ui_configuredialog import Ui_ConfigureDialog
+from mapclientplugins.createhemispheremodelstep.hemispheremesh import estimatehemispheremodel, gethemisphereconfigproblems
 
 INVALID_STYLE_SHEET = 'background-color: rgba(239, 0, 0, 50)'
 DEFAULT_STYLE_SHEET = ''
 
 STRING_FLOAT_FORMAT = '{:.5g}'
 
+# configurations estimated to exceed either limit are flagged with a warning style, but
+# remain valid since the estimate constants are not calibrated against Zinc output
+MAX_ESTIMATED_BYTES = 1 << 30
+MAX_ESTIMATED_RUNTIME = 300.0
+
 class ConfigureDialog(QtGui.QDialog):
     '''
     Configure dialog to present the user with the options to configure this step.
@@ -69,6 +75,46 @@ class ConfigureDialog(QtGui.QDialog):
         else:
             self._ui.lineEdit0.setStyleSheet(INVALID_STYLE_SHEET)
 
+        sizeValid = self._validateSize()
+        return valid and sizeValid
+
+    def _validateSize(self):
+        '''
+        Check the element counts can make a hemisphere mesh and estimate the
+        model size from them, show the problems or estimate as the tool tip
+        of the element count fields and flag the invalid fields, or all of
+        them if the model is estimated to be oversized.
+        Return True if the element counts are valid; an oversized estimate is
+        only flagged, not treated as invalid.
+        '''
+        widgets = {
+            'elements around': self._ui.elementsAroundLineEdit,
+            'elements up': self._ui.elementsUpLineEdit,
+            'elements along stem': self._ui.elementsAlongStemLineEdit }
+        try:
+            config = {}
+            for key, widget in widgets.items():
+                config[key] = int(widget.text())
+        except ValueError:
+            return False
+        problems = gethemisphereconfigproblems(config)
+        if problems:
+            invalidKeys = set(key for key, message in problems)
+            toolTip = ' '.join(message + '.' for key, message in problems)
+            valid = False
+        else:
+            estimate = estimatehemispheremodel(config)
+            valid = True
+            oversized = (estimate['bytes'] > MAX_ESTIMATED_BYTES) or (estimate['runtime'] > MAX_ESTIMATED_RUNTIME)
+            invalidKeys = set(widgets) if oversized else set()
+            toolTip = 'Estimated: {} nodes, {} elements, {} lines, approx. {:.3g} MB output, {:.3g} MB memory, {:.3g} s'.format(
+                estimate['nodes'], estimate['elements'], estimate['lines'], estimate['bytes']/1.0E6,
+                estimate['peak memory']/1.0E6, estimate['runtime'])
+            if oversized:
+                toolTip = 'Model may be too large. ' + toolTip
+        for key, widget in widgets.items():
+            widget.setToolTip(toolTip)
+            widget.setStyleSheet(INVALID_STYLE_SHEET if key in invalidKeys else DEFAULT_STYLE_SHEET)
         return valid
 
     def getConfig(self):
@@ -131,12 +177,15 @@ class ConfigureDialog(QtGui.QDialog):
 
     def _elementsAroundLineEditEntered(self):
         self._parseInt(self._ui.elementsAroundLineEdit, 12)
+        self.validate()
 
     def _elementsUpLineEditEntered(self):
         self._parseInt(self._ui.elementsUpLineEdit, 3)
+        self.validate()
 
     def _elementsAlongStemLineEditEntered(self):
         self._parseInt(self._ui.elementsAlongStemLineEdit, 1)
+        self.validate()
 
     #def _radiusLineEditEntered(self):
     #    self._parseReal(self._ui.radiusLineEdit, 1.0)
@@ -0,0 +1,602 @@
+"""
+Hemisphere mesh node parameters, element connectivity, node transforms and
+processing of the EX file written by Zinc, all independent of Zinc.
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+
+import functools
+import math
+import os
+import re
+import numpy
+
+# element field header variants; all except HEADER_NORMAL have a scale factor of -1
+HEADER_NORMAL = 0
+HEADER_1 = 1
+HEADER_2 = 2
+HEADER_3 = 3
+HEADER_REVERSE = 4
+HEADER_4 = 5
+# value labels and scale factor indices for local nodes 1-4 of each element field header variant
+_NODE_VALUES_NORMAL = ('value d/ds1 d/ds2 d2/ds1ds2', '0 0 0 0')
+HEADER_NODE_VALUES = {
+    HEADER_NORMAL: (_NODE_VALUES_NORMAL, _NODE_VALUES_NORMAL, _NODE_VALUES_NORMAL, _NODE_VALUES_NORMAL),
+    HEADER_1: (('value zero d/ds1 zero', '0 0 1 0'), ('value zero d/ds2 zero', '0 0 0 0'), _NODE_VALUES_NORMAL, _NODE_VALUES_NORMAL),
+    HEADER_2: (('value zero d/ds2 zero', '0 0 0 0'), ('value zero d/ds1 zero', '0 0 0 0'), _NODE_VALUES_NORMAL, _NODE_VALUES_NORMAL),
+    HEADER_3: (('value zero d/ds1 zero', '0 0 0 0'), ('value zero d/ds2 zero', '0 0 1 0'), _NODE_VALUES_NORMAL, _NODE_VALUES_NORMAL),
+    HEADER_REVERSE: (('value d/ds1 d/ds2 d2/ds1ds2', '0 1 1 0'), ('value d/ds1 d/ds2 d2/ds1ds2', '0 1 1 0'), _NODE_VALUES_NORMAL, _NODE_VALUES_NORMAL),
+    HEADER_4: (('value zero d/ds2 zero', '0 0 1 0'), ('value zero d/ds1 zero', '0 0 1 0'), _NODE_VALUES_NORMAL, _NODE_VALUES_NORMAL) }
+
+# approximate costs per node, 2D element and line (face) element used by estimatehemispheremodel.
+# These are uncalibrated: output bytes are derived from the EX format with 3 components x 4
+# values per node in Zinc's 15 significant digit exponent format; memory and runtime per object
+# are rough guesses for Zinc models built through the Python bindings, not measurements.
+ESTIMATE_BYTES_PER_NODE = 330
+ESTIMATE_BYTES_PER_ELEMENT = 160
+ESTIMATE_BYTES_PER_LINE = 40
+ESTIMATE_MEMORY_PER_NODE = 600
+ESTIMATE_MEMORY_PER_ELEMENT = 400
+ESTIMATE_MEMORY_PER_LINE = 150
+ESTIMATE_SECONDS_PER_NODE = 3.0E-5
+ESTIMATE_SECONDS_PER_ELEMENT = 2.5E-5
+ESTIMATE_SECONDS_PER_LINE = 5.0E-6
+ESTIMATE_SECONDS_PER_BYTE = 1.0E-8
+
+# block size read at a time when verifying output
+VERIFY_BLOCK_SIZE = 1 << 22
+
+# lines of the EX format checked when verifying output
+VERIFY_LINE_PATTERN = re.compile(r"\n *(Node:|Element:|Shape\. Dimension=|#Scale factor sets=|Value labels:|Scale factor indices:|Scale factors:)([^\n]*)")
+# text in every element field header and scale factor block; blocks without it only
+# have records under the current header
+VERIFY_HEADER_MARKER = b"Scale factor"
+
+def gethemispherenodes(nElementsAround, nElementsUp, nElementsExtra):
+    """
+    Get the node parameters of the unit hemisphere and stem, independent of Zinc.
+    :return: float array of shape (nNodes, 4, 3) giving the value, d/ds1, d/ds2
+    and d2/ds1ds2 coordinates of each node in identifier order.
+    """
+    nodeParameters = []
+    radiansPerElementAround = 2.0 * math.pi / nElementsAround
+    d2x_ds1ds2 = [0.0, 0.0, 0.0]
+
+    # first row
+    nNodesFirstRow = nElementsAround // 2 - 1
+    nNodesFirstRow_2 = nNodesFirstRow // 2
+    radiansPerElementUp = math.pi / 2.0 / nElementsUp
+    firstRowFraction = 0.75
+    radiansPerFirstRowNode = 4.0 * firstRowFraction * radiansPerElementUp / nElementsAround
+    radiansPerFirstRowNodeScaled = radiansPerFirstRowNode * (1.0 + nNodesFirstRow) / nNodesFirstRow / firstRowFraction
+    for na in range(nNodesFirstRow):
+        f1 = math.fabs(na - nNodesFirstRow_2) / nNodesFirstRow_2
+        f2 = 1.0 - f1
+        radiansX = (na - nNodesFirstRow_2) * radiansPerFirstRowNode
+        sinRadiansX = math.sin(radiansX)
+        cosRadiansX = math.cos(radiansX)
+        x = [sinRadiansX, 0.0, -cosRadiansX]
+        dx_ds1 = [radiansPerFirstRowNode*cosRadiansX, 0.0, radiansPerFirstRowNode*sinRadiansX]
+        dx_ds2 = [0.0, -(f1 * radiansPerFirstRowNodeScaled + f2 * radiansPerElementUp), 0.0]
+        nodeParameters.append([x, dx_ds1, dx_ds2, d2x_ds1ds2])
+
+    # remaining rows on hemisphere
+    for nu in range(nElementsUp):
+        radiansUp = (nu + 1) * radiansPerElementUp
+        cosRadiansUp = math.cos(radiansUp)
+        sinRadiansUp = math.sin(radiansUp)
+        for na in range(nElementsAround):
+            radiansAround = na * radiansPerElementAround
+            cosRadiansAround = math.cos(radiansAround)
+            sinRadiansAround = math.sin(radiansAround)
+            x = [-cosRadiansAround * sinRadiansUp, -sinRadiansAround * sinRadiansUp, -cosRadiansUp]
+            dx_ds1 = [sinRadiansAround * sinRadiansUp * radiansPerElementAround, \
+                      -cosRadiansAround * sinRadiansUp * radiansPerElementAround,
+                      0.0]
+            dx_ds2 = [-cosRadiansAround * cosRadiansUp * radiansPerElementUp, \
+                      -sinRadiansAround * cosRadiansUp * radiansPerElementUp, \
+                      sinRadiansUp * radiansPerElementUp]
+            nodeParameters.append([x, dx_ds1, dx_ds2, d2x_ds1ds2])
+
+    # remaining extra rows on the straight
+    for ne in range(nElementsExtra):
+        for na in range(nElementsAround):
+            radiansAround = na * radiansPerElementAround
+            cosRadiansAround = math.cos(radiansAround)
+            sinRadiansAround = math.sin(radiansAround)
+            x = [-cosRadiansAround, -sinRadiansAround, (ne + 1) * radiansPerElementUp]
+            dx_ds1 = [sinRadiansAround * radiansPerElementAround, -cosRadiansAround * radiansPerElementAround, 0.0]
+            dx_ds2 = [0.0, 0.0, radiansPerElementUp]
+            nodeParameters.append([x, dx_ds1, dx_ds2, d2x_ds1ds2])
+
+    return numpy.array(nodeParameters)
+
+def gethemisphereelementnodes(nElementsAround, nElementsUp, nElementsExtra):
+    """
+    Get the 2D element connectivity of the hemisphere and stem, independent of Zinc.
+    Elements are in identifier order: the first row fanning out from the apex
+    nodes, then the regular rows up the hemisphere and along the stem.
+    :return: elementNodes, elementHeaders. elementNodes is an int array of shape
+    (nElements, 4) giving the identifiers of each element's local nodes 1-4.
+    elementHeaders is an int8 array giving the HEADER_ variant for each element.
+    """
+    nNodesFirstRow = nElementsAround // 2 - 1
+    nElementsRegular = nElementsUp - 1 + nElementsExtra
+
+    # first row: fan from the first node, regular half, two mid-pole elements,
+    # reversed half, then the closing element back to the first node
+    n = nNodesFirstRow
+    ea = numpy.arange(1, n)
+    firstRowNodes = numpy.concatenate((
+        [[1, 1, n + 1, n + 2]],
+        numpy.column_stack((ea, ea + 1, n + ea + 1, n + ea + 2)),
+        [[n, n, 2*n + 1, 2*n + 2], [n, n, 2*n + 2, 2*n + 3]],
+        numpy.column_stack((n - ea + 1, n - ea, 2*n + ea + 2, 2*n + ea + 3)),
+        [[1, 1, n + nElementsAround, n + 1]])).astype(int)
+
+    # remaining regular rows
+    baseNodeIdentifier = 1 + n + nElementsAround*numpy.arange(nElementsRegular)[:, numpy.newaxis]
+    ea = numpy.arange(nElementsAround)
+    ea2 = (ea + 1) % nElementsAround
+    regularNodes = numpy.dstack((baseNodeIdentifier + ea, baseNodeIdentifier + ea2,
+        baseNodeIdentifier + nElementsAround + ea, baseNodeIdentifier + nElementsAround + ea2)).reshape(-1, 4)
+
+    elementNodes = numpy.concatenate((firstRowNodes, regularNodes))
+    elementHeaders = numpy.zeros(len(elementNodes), dtype=numpy.int8)
+    elementHeaders[0] = HEADER_1
+    elementHeaders[n] = HEADER_2
+    elementHeaders[n + 1] = HEADER_3
+    elementHeaders[n + 2:2*n + 1] = HEADER_REVERSE
+    elementHeaders[2*n + 1] = HEADER_4
+    return elementNodes, elementHeaders
+
+def affinetransformnodes(nodeParameters, matrix, offset=None):
+    """
+    Apply the affine transformation x' = matrix.x + offset to node coordinates.
+    Derivatives are transformed by matrix.
+    :param nodeParameters: Array of shape (nNodes, 4, 3) as returned by gethemispherenodes.
+    :param matrix: 3x3 matrix.
+    :param offset: Optional translation vector.
+    :return: Transformed node parameters array.
+    """
+    result = numpy.dot(nodeParameters, numpy.transpose(matrix))
+    if offset is not None:
+        result[:, 0] += offset
+    return result
+
+def deformnodes(nodeParameters, deformation):
+    """
+    Apply a vectorized per-node deformation to node coordinates, transforming
+    derivatives by the chain rule.
+    :param nodeParameters: Array of shape (nNodes, 4, 3) as returned by gethemispherenodes.
+    :param deformation: Callable taking an (nNodes, 3) coordinates array and returning
+    (newCoordinates, jacobian) or (newCoordinates, jacobian, hessian), where
+    jacobian[n, i, j] = dx'i/dxj and hessian[n, i, j, k] = d2x'i/dxjdxk. Without the
+    hessian the cross derivative d2/ds1ds2 is transformed by the jacobian only,
+    which is exact for deformations that are affine at each node.
+    :return: Transformed node parameters array.
+    """
+    deformed = deformation(nodeParameters[:, 0])
+    jacobian = deformed[1]
+    result = numpy.empty_like(nodeParameters)
+    result[:, 0] = deformed[0]
+    result[:, 1:] = numpy.einsum('nij,nvj->nvi', jacobian, nodeParameters[:, 1:])
+    if len(deformed) > 2:
+        result[:, 3] += numpy.einsum('nijk,nj,nk->ni', deformed[2], nodeParameters[:, 1], nodeParameters[:, 2])
+    return result
+
+def _stretchstem(coordinates, factor, firstStemNodeIndex):
+    """
+    Deformation scaling z by factor on the stem, which is all nodes from
+    index firstStemNodeIndex in the order of gethemispherenodes.
+    """
+    newCoordinates = coordinates.copy()
+    newCoordinates[firstStemNodeIndex:, 2] *= factor
+    jacobian = numpy.tile(numpy.identity(3), (len(coordinates), 1, 1))
+    jacobian[firstStemNodeIndex:, 2, 2] = factor
+    return newCoordinates, jacobian
+
+def getconfigtransforms(config):
+    """
+    :return: List of transforms scaling the unit hemisphere by config 'radius'
+    then stretching the stem to config 'stem length', with the step's defaults
+    of 1.0 and 0.5 if they are not set.
+    """
+    radius = config.get('radius', 1.0)
+    transforms = [ functools.partial(affinetransformnodes, matrix=numpy.identity(3)*radius) ]
+    nElementsAround = config['elements around']
+    nElementsUp = config['elements up']
+    nElementsExtra = config['elements along stem']
+    if nElementsExtra > 0:
+        scaledStemLength = radius*nElementsExtra*math.pi/2.0/nElementsUp
+        firstStemNodeIndex = nElementsAround // 2 - 1 + nElementsUp*nElementsAround
+        transforms.append(functools.partial(deformnodes, deformation=functools.partial(_stretchstem,
+            factor=config.get('stem length', 0.5)/scaledStemLength, firstStemNodeIndex=firstStemNodeIndex)))
+    return transforms
+
+def getvariantnodeparameters(baseNodeParameters, transformsList):
+    """
+    Generate the node parameters of each variant by applying its transforms in
+    order to a copy of the base node parameters, so transforms may modify the
+    array in place without affecting the base or later variants.
+    :param baseNodeParameters: Array of shape (nNodes, 4, 3) as returned by gethemispherenodes.
+    :param transformsList: List of transform lists, one per variant.
+    :return: Generator yielding for each variant its node parameters, or None
+    if they are the base node parameters and the previous variant's were too,
+    starting with the base node parameters already set.
+    """
+    currentIsBase = True
+    for transforms in transformsList:
+        if transforms:
+            nodeParameters = baseNodeParameters.copy()
+            for transform in transforms:
+                nodeParameters = transform(nodeParameters)
+            currentIsBase = False
+            yield nodeParameters
+        elif currentIsBase:
+            yield None
+        else:
+            currentIsBase = True
+            yield baseNodeParameters
+
+def _getheaderruns(elementHeaders):
+    """
+    :return: List of (header, count) for runs of consecutive elements with the same header.
+    """
+    starts = numpy.concatenate(([0], numpy.flatnonzero(elementHeaders[1:] != elementHeaders[:-1]) + 1))
+    counts = numpy.diff(numpy.append(starts, len(elementHeaders)))
+    return list(zip(elementHeaders[starts].tolist(), counts.tolist()))
+
+def _getnodeandelementcounts(config):
+    """
+    :return: Number of nodes, number of 2D elements as made by gethemispherenodes
+    and gethemisphereelementnodes.
+    """
+    nElementsAround = config['elements around']
+    nRows = config['elements up'] + config['elements along stem']
+    nNodesFirstRow = nElementsAround // 2 - 1
+    return nNodesFirstRow + nRows*nElementsAround, 2*nNodesFirstRow + 2 + (nRows - 1)*nElementsAround
+
+def _getlinecount(config):
+    """
+    :return: Number of distinct element edges including the 2 collapsed apex
+    edges, which is the number of line elements defined by Zinc defineAllFaces.
+    """
+    nElementsAround = config['elements around']
+    nRows = config['elements up'] + config['elements along stem']
+    nNodesFirstRow = nElementsAround // 2 - 1
+    # first row: edges between apex nodes and up to the first ring
+    nLines = nNodesFirstRow + 1 + nElementsAround
+    # first ring: first row elements leave one edge out if elements around is odd
+    nLines += nElementsAround if (nRows > 1) else 2*nNodesFirstRow + 2
+    # regular rows: edges up to and around each further ring
+    return nLines + (nRows - 1)*2*nElementsAround
+
+def gethemisphereconfigproblems(config):
+    """
+    Check the element counts in config can make a closed hemisphere mesh.
+    :return: List of (config key, message) for each problem found; empty if valid.
+    """
+    problems = []
+    nElementsAround = config['elements around']
+    if nElementsAround < 6:
+        problems.append(('elements around', "Elements around must be at least 6"))
+    elif nElementsAround % 2:
+        problems.append(('elements around', "Elements around must be even"))
+    if config['elements up'] < 1:
+        problems.append(('elements up', "Elements up must be at least 1"))
+    if config['elements along stem'] < 0:
+        problems.append(('elements along stem', "Elements along stem must not be negative"))
+    return problems
+
+def estimatehemispheremodel(config):
+    """
+    Predict the size and cost of writehemispheremodel for config without generating it.
+    Node, element and line counts are exact, with lines including the 2
+    collapsed apex edges; bytes, memory and runtime are uncalibrated approximations.
+    :param config:
+    :return: dict with keys 'nodes', 'elements', 'lines', 'bytes', 'peak memory' (bytes)
+    and 'runtime' (seconds).
+    """
+    nNodes, nElements = _getnodeandelementcounts(config)
+    nLines = _getlinecount(config)
+    outputBytes = nNodes*ESTIMATE_BYTES_PER_NODE + nElements*ESTIMATE_BYTES_PER_ELEMENT + nLines*ESTIMATE_BYTES_PER_LINE
+    # Zinc model plus the output buffer and the segments sliced from it
+    peakMemory = nNodes*ESTIMATE_MEMORY_PER_NODE + nElements*ESTIMATE_MEMORY_PER_ELEMENT + \
+        nLines*ESTIMATE_MEMORY_PER_LINE + 2*outputBytes
+    runtime = nNodes*ESTIMATE_SECONDS_PER_NODE + nElements*ESTIMATE_SECONDS_PER_ELEMENT + \
+        nLines*ESTIMATE_SECONDS_PER_LINE + outputBytes*ESTIMATE_SECONDS_PER_BYTE
+    return {
+        'nodes': nNodes,
+        'elements': nElements,
+        'lines': nLines,
+        'bytes': outputBytes,
+        'peak memory': peakMemory,
+        'runtime': runtime }
+
+def _findrequired(text, sub, start=0):
+    """
+    :return: Location of sub in text at or after start. Raises ValueError if not found.
+    """
+    loc = text.find(sub, start)
+    if loc < 0:
+        raise ValueError("Failed to find '" + sub.strip() + "' in output after location " + str(start))
+    return loc
+
+def _replacerequired(text, old, new):
+    """
+    :return: Copy of text with old replaced by new. Raises ValueError if old is not in text.
+    """
+    if old not in text:
+        raise ValueError("Failed to find element header text to replace: " + repr(old.strip()[:40]))
+    return text.replace(old, new)
+
+def writesegments(filenameOut, segments):
+    """
+    Write string segments to file in order.
+    :param filenameOut:
+    :param segments: List of strings to write.
+    :return: None
+    """
+    outfile = open(filenameOut, 'w')
+    for segment in segments:
+        outfile.write(segment)
+    outfile.close()
+
+def _getheadernodestext(header):
+    """
+    :return: Local node section of a component in an EX element field header for header variant.
+    """
+    text = "\n   #Nodes=4"
+    for localNode, (labels, indices) in enumerate(HEADER_NODE_VALUES[header], 1):
+        text += "\n   " + str(localNode) + ". #Values=4\n     Value labels: " + labels + \
+            "\n     Scale factor indices: " + indices
+    return text
+
+def getexsegments(buffer, elementHeaders):
+    """
+    Get the EX file for the hemisphere model as written by Zinc in buffer, with
+    the element field header variant and scale factors given by elementHeaders
+    inserted for each 2D element. Raises ValueError if buffer is not as expected.
+    :param buffer: EX format string written by Zinc.
+    :param elementHeaders: Header variant for each 2D element from gethemisphereelementnodes.
+    :return: List of strings to write in order.
+    """
+    elements2dLoc = _findrequired(buffer, " Shape. Dimension=2")
+
+    headerLoc = _findrequired(buffer, " #Scale factor sets", elements2dLoc)
+    segments = [ buffer[0:headerLoc] ]
+    elementLoc = _findrequired(buffer, " Element:", headerLoc)
+    headers = {}
+    headers[HEADER_NORMAL] = headerNormal = buffer[headerLoc:elementLoc]
+    headerScaleFactors = _replacerequired(headerNormal, " #Scale factor sets=0\n", \
+        " #Scale factor sets=1\n   c.Hermite*c.Hermite, #Scale factors=1\n")
+    nodesTextNormal = _getheadernodestext(HEADER_NORMAL)
+    for header in (HEADER_1, HEADER_2, HEADER_3, HEADER_REVERSE, HEADER_4):
+        headers[header] = _replacerequired(headerScaleFactors, nodesTextNormal, _getheadernodestext(header))
+
+    nElements = len(elementHeaders)
+    elementIndex = 0
+    for header, count in _getheaderruns(elementHeaders):
+        segments.append(headers[header])
+        if (header == HEADER_NORMAL) and ((elementIndex + count) == nElements):
+            # no more headers to insert: write remaining elements in one slice
+            segments.append(buffer[elementLoc:])
+            break
+        for i in range(count):
+            elementIndex += 1
+            elementLoc2 = _findrequired(buffer, " Element:", elementLoc + 1) if (elementIndex < nElements) else len(buffer)
+            segments.append(buffer[elementLoc:elementLoc2])
+            if header != HEADER_NORMAL:
+                segments.append("Scale factors:\n-1\n")
+            elementLoc = elementLoc2
+    return segments
+
+def _getlinevalue(block, key, loc):
+    """
+    :return: Rest of the line in bytes block after key at loc.
+    """
+    end = block.find(b'\n', loc)
+    return block[loc + len(key):(end if (end >= 0) else len(block))]
+
+def _countrecords(block, key):
+    """
+    :return: Number of records starting with key in bytes block, and the sum of the
+    integers on the line of the last one, which is its identifier, or None.
+    """
+    count = block.count(key)
+    if count == 0:
+        return 0, None
+    return count, sum(int(token) for token in _getlinevalue(block, key, block.rfind(key)).split())
+
+def _matchheader(hasScaleFactors, headerNodeValues):
+    """
+    :return: The header variant with hasScaleFactors and with the same value labels
+    and scale factor indices for the local nodes of every component as
+    headerNodeValues, or None if there is none.
+    """
+    nodeValues = [ tuple(values) for values in headerNodeValues ]
+    for header, values in HEADER_NODE_VALUES.items():
+        if ((header != HEADER_NORMAL) == hasScaleFactors) and nodeValues and \
+                (nodeValues == list(values)*(len(nodeValues) // 4)):
+            return header
+    return None
+
+def verifyhemispheremodel(filename, config):
+    """
+    Check the written hemisphere model in a single streaming pass: node and
+    element counts, identifier continuity, and that each 2D element has the
+    field header variant from gethemisphereelementnodes, matched by its scale
+    factor set and the value labels and scale factor indices of every local
+    node, plus its scale factor block. Lines are parsed individually only up to
+    the first record after each header and under headers with scale factors;
+    the remaining records, which are most of the file, are checked by counting
+    them and parsing only the last identifier in each block.
+    Raises ValueError describing the first problem found.
+    :param filename:
+    :param config:
+    :return: None
+    """
+    nNodesExpected, nElementsExpected = _getnodeandelementcounts(config)
+    elementHeaders = gethemisphereelementnodes(config['elements around'], config['elements up'], config['elements along stem'])[1].tolist()
+    nodeIdentifier = 0
+    lineIdentifier = 0
+    elementIdentifier = 0
+    dimension = 0
+    hasScaleFactors = False
+    headerNodeValues = []
+    header = None
+    scaleFactorsCount = 0
+    scaleFactorsExpected = False
+
+    def checkScaleFactors():
+        if (scaleFactorsCount != (1 if scaleFactorsExpected else 0)):
+            raise ValueError("Element " + str(elementIdentifier) + " has " + str(scaleFactorsCount) + " scale factor blocks")
+
+    # blocks are read as bytes and only the part parsed line by line is decoded
+    infile = open(filename, 'rb')
+    # blocks are cut before the newline starting the last record in them, so
+    # every line is matched with its leading newline and headers, which are
+    # between records, are never split
+    remainder = b'\n'
+    while True:
+        block = infile.read(VERIFY_BLOCK_SIZE)
+        if block:
+            block = remainder + block
+            end = block.rfind(b'\n Element:')
+            if end < 0:
+                end = block.rfind(b'\n Node:')
+            if end <= 0:
+                remainder = block
+                continue
+            remainder = block[end:]
+            block = block[:end]
+        else:
+            block = remainder
+            remainder = None
+        # parse lines up to the end of the first record after the last header line
+        markerLoc = block.rfind(VERIFY_HEADER_MARKER)
+        bulkLoc = 0
+        headerHasScaleFactors = hasScaleFactors
+        if markerLoc >= 0:
+            bulkLoc = block.find(b" Element:", markerLoc)
+            bulkLoc = block.find(b'\n', bulkLoc) if (bulkLoc >= 0) else -1
+            if bulkLoc < 0:
+                bulkLoc = len(block)
+            setsLoc = block.rfind(b"#Scale factor sets=", 0, markerLoc + 1)
+            if setsLoc >= 0:
+                headerHasScaleFactors = int(_getlinevalue(block, b"#Scale factor sets=", setsLoc)) > 0
+        if headerHasScaleFactors:
+            # records under a header with scale factors need parsing
+            bulkLoc = len(block)
+        for match in VERIFY_LINE_PATTERN.finditer(block[:bulkLoc].decode('utf-8')):
+            key, value = match.groups()
+            if key == 'Node:':
+                nodeIdentifier += 1
+                if int(value) != nodeIdentifier:
+                    raise ValueError("Node " + value.strip() + " found, expected " + str(nodeIdentifier))
+            elif key == 'Element:':
+                identifier = sum(int(token) for token in value.split())
+                if dimension == 2:
+                    if elementIdentifier > 0:
+                        checkScaleFactors()
+                    elementIdentifier += 1
+                    if identifier != elementIdentifier:
+                        raise ValueError("Element " + str(identifier) + " found, expected " + str(elementIdentifier))
+                    if header is None:
+                        header = _matchheader(hasScaleFactors, headerNodeValues)
+                    expectedHeader = elementHeaders[elementIdentifier - 1] if (elementIdentifier <= len(elementHeaders)) else HEADER_NORMAL
+                    if header != expectedHeader:
+                        raise ValueError("Element " + str(elementIdentifier) + " has field header variant " + str(header) + \
+                            ", expected " + str(expectedHeader))
+                    scaleFactorsCount = 0
+                    scaleFactorsExpected = hasScaleFactors
+                else:
+                    lineIdentifier += 1
+                    if identifier != lineIdentifier:
+                        raise ValueError("Line element " + str(identifier) + " found, expected " + str(lineIdentifier))
+            elif key == 'Shape. Dimension=':
+                dimension = int(value.split(',')[0])
+            elif key == '#Scale factor sets=':
+                hasScaleFactors = int(value) > 0
+                headerNodeValues = []
+                header = None
+            elif dimension != 2:
+                pass
+            elif key == 'Value labels:':
+                headerNodeValues.append([value.strip(), None])
+            elif key == 'Scale factor indices:':
+                if headerNodeValues:
+                    headerNodeValues[-1][1] = value.strip()
+            else:
+                scaleFactorsCount += 1
+        if bulkLoc < len(block):
+            # only records under the current header, with no scale factors:
+            # Zinc writes them in identifier order with all nodes before any
+            # elements, so compare their count with the last identifier
+            bulk = block[bulkLoc:] if bulkLoc else block
+            count, identifier = _countrecords(bulk, b" Node:" if (dimension == 0) else b" Element:")
+            if not count:
+                pass
+            elif dimension == 0:
+                if identifier != nodeIdentifier + count:
+                    raise ValueError("Node " + str(identifier) + " found, expected " + str(nodeIdentifier + count))
+                nodeIdentifier = identifier
+                pass
+            elif dimension == 2:
+                if elementIdentifier > 0:
+                    checkScaleFactors()
+                if identifier != elementIdentifier + count:
+                    raise ValueError("Element " + str(identifier) + " found, expected " + str(elementIdentifier + count))
+                if header is None:
+                    header = _matchheader(hasScaleFactors, headerNodeValues)
+                expectedHeaders = elementHeaders[elementIdentifier:identifier]
+                if expectedHeaders.count(header) != len(expectedHeaders):
+                    for index, expectedHeader in enumerate(expectedHeaders):
+                        if expectedHeader != header:
+                            raise ValueError("Element " + str(elementIdentifier + index + 1) + " has field header variant " + \
+                                str(header) + ", expected " + str(expectedHeader))
+                elementIdentifier = identifier
+                scaleFactorsCount = 0
+                scaleFactorsExpected = False
+            else:
+                if identifier != lineIdentifier + count:
+                    raise ValueError("Line element " + str(identifier) + " found, expected " + str(lineIdentifier + count))
+                lineIdentifier = identifier
+        if remainder is None:
+            break
+    infile.close()
+
+    if elementIdentifier > 0:
+        checkScaleFactors()
+    if nodeIdentifier != nNodesExpected:
+        raise ValueError("Found " + str(nodeIdentifier) + " nodes, expected " + str(nNodesExpected))
+    if elementIdentifier != nElementsExpected:
+        raise ValueError("Found " + str(elementIdentifier) + " elements, expected " + str(nElementsExpected))
+
+def writehemisphereexfile(filenameOut, buffer, config, elementHeaders, verify=True):
+    """
+    Write the hemisphere model EX file from the buffer written by Zinc, with
+    element header variants inserted by getexsegments. The file is written
+    under a temporary name and only renamed to filenameOut once it has been
+    written and, if verify is True, passed verifyhemispheremodel, so a corrupt
+    model is never left at filenameOut.
+    :param filenameOut:
+    :param buffer: EX format string written by Zinc.
+    :param config:
+    :param elementHeaders: Header variant for each 2D element from gethemisphereelementnodes.
+    :param verify: If True, check the file with verifyhemispheremodel before renaming.
+    :return: None
+    """
+    filenameTemp = filenameOut + '.part'
+    try:
+        writesegments(filenameTemp, getexsegments(buffer, elementHeaders))
+        if verify:
+            verifyhemispheremodel(filenameTemp, config)
+    except:
+        if os.path.exists(filenameTemp):
+            os.remove(filenameTemp)
+        raise
+    os.replace(filenameTemp, filenameOut)
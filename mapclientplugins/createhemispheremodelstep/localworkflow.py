@@ -0,0 +1,50 @@
+'''
+Local runner for executing workflow steps concurrently without the MAP Client
+application, for exercising steps with executeAsync() from AsyncFileStepMixin
+such as CreateHemisphereModelStep. It needs only the steps' registerDoneExecution(),
+execute() and executeAsync(executor, dispatch) methods.
+'''
+import asyncio
+
+def runsteps(steps, executor):
+    '''
+    Execute independent steps as a concurrent workflow runner would. Steps
+    with executeAsync() are all started in executor, then any other steps are
+    executed in turn while those run. Done execution of every step is handled
+    on the calling thread by an asyncio event loop run until all have finished.
+    Returns the list of steps in the order they signalled done execution.
+    Raises the first exception from any step once all steps already started
+    have finished.
+    '''
+    completed = []
+
+    def makeDoneExecution(step):
+        def doneExecution():
+            completed.append(step)
+        return doneExecution
+
+    loop = asyncio.new_event_loop()
+    futures = []
+
+    async def waitsteps():
+        return await asyncio.gather(*[ asyncio.wrap_future(future) for future in futures ], return_exceptions=True)
+
+    try:
+        for step in steps:
+            step.registerDoneExecution(makeDoneExecution(step))
+            if hasattr(step, 'executeAsync'):
+                futures.append(step.executeAsync(executor, loop.call_soon_threadsafe))
+        for step in steps:
+            if not hasattr(step, 'executeAsync'):
+                step.execute()
+    finally:
+        # run steps already started to completion, even if another step
+        # raised, so none completes on a closed loop
+        try:
+            results = loop.run_until_complete(waitsteps())
+        finally:
+            loop.close()
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return completed
@@ -2,22 +2,46 @@
 '''
 MAP Client Plugin Step
 '''
-from os.path import join, isdir
-from os import mkdir
 import json
 
-from PySide import QtGui
+from PySide import QtCore, QtGui
 
 from mapclient.mountpoints.workflowstep import WorkflowStepMountPoint
+from mapclientplugins.createhemispheremodelstep.asyncexecution import AsyncFileStepMixin
 from mapclientplugins.createhemispheremodelstep.configuredialog import ConfigureDialog
 from mapclientplugins.createhemispheremodelstep.createhemispheremodel import writehemispheremodel
 
-class CreateHemisphereModelStep(WorkflowStepMountPoint):
+class _ThreadDispatcher(QtCore.QObject):
+    '''
+    Runs functions emitted from any thread on the thread this object was
+    created in, through a queued signal handled by its Qt event loop.
+    '''
+
+    dispatched = QtCore.Signal(object, object)
+
+    def __init__(self):
+        super(_ThreadDispatcher, self).__init__()
+        self.dispatched.connect(self._run, QtCore.Qt.QueuedConnection)
+
+    def dispatch(self, function, *args):
+        self.dispatched.emit(function, args)
+
+    @QtCore.Slot(object, object)
+    def _run(self, function, args):
+        function(*args)
+
+class CreateHemisphereModelStep(AsyncFileStepMixin, WorkflowStepMountPoint):
     '''
     Skeleton step which is intended to be a helpful starting point
     for new steps.
+    executeAsync() from AsyncFileStepMixin runs model generation in an
+    executor. Zinc holds the GIL while generating, so use a process pool
+    executor for generation of several models to overlap.
     '''
 
+    _writeFile = staticmethod(writehemispheremodel)
+    _outputFilename = 'hemisphere.exfile'
+
     def __init__(self, location):
         super(CreateHemisphereModelStep, self).__init__('Create Hemisphere Model', location)
         self._configured = False # A step cannot be executed until it has been configured.
@@ -38,6 +62,8 @@ class CreateHemisphereModelStep(WorkflowStepMountPoint):
         self._config['elements along stem'] = 1
         self._config['radius'] = 1.0
         self._config['stem length'] = 0.5
+        # completes executeAsync on the thread which created the step
+        self._dispatcher = _ThreadDispatcher()
 
     def execute(self):
         '''
@@ -46,11 +72,7 @@ class CreateHemisphereModelStep(WorkflowStepMountPoint):
         may be connected up to a button in a widget for example.
         '''
         # Put your execute step code here before calling the '_doneExecution' method.
-        output_dir = join(self._location, self.getIdentifier() + '_output')
-        if not isdir(output_dir):
-            mkdir(output_dir)
-
-        self._portData0 = join(output_dir, 'hemisphere.exfile')
+        self._portData0 = self._makeOutputFilename()
         writehemispheremodel(self._portData0, self._config)
         self._doneExecution()
 
@@ -0,0 +1,9 @@
+"""
+Put the plugin source directory on the path so its modules which do not need
+Zinc, PySide or MAP Client can be tested without importing the plugin package.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'mapclientplugins', 'createhemispheremodelstep'))
@@ -0,0 +1,355 @@
+"""
+Tests of the Zinc-independent hemisphere mesh generation and EX file processing.
+"""
+import functools
+import os
+import numpy
+import pytest
+
+import hemispheremesh
+from hemispheremesh import HEADER_NORMAL, HEADER_1, HEADER_2, HEADER_3, HEADER_REVERSE, HEADER_4, \
+    affinetransformnodes, deformnodes, estimatehemispheremodel, getconfigtransforms, gethemisphereconfigproblems, \
+    gethemisphereelementnodes, gethemispherenodes, getvariantnodeparameters, verifyhemispheremodel, \
+    writehemisphereexfile, _getheaderruns, _getnodeandelementcounts
+
+def _getloopelementnodes(nElementsAround, nElementsUp, nElementsExtra):
+    """
+    Element nodes as defined by the original loops calling elementtemplate.setNode.
+    """
+    n = nElementsAround // 2 - 1
+    elementNodes = [ [1, 1, n + 1, n + 2] ]
+    for ea in range(1, n):
+        elementNodes.append([ea, ea + 1, n + ea + 1, n + ea + 2])
+    elementNodes.append([n, n, 2*n + 1, 2*n + 2])
+    elementNodes.append([n, n, 2*n + 2, 2*n + 3])
+    for ea in range(1, n):
+        elementNodes.append([n - ea + 1, n - ea, 2*n + ea + 2, 2*n + ea + 3])
+    elementNodes.append([1, 1, n + nElementsAround, n + 1])
+    for er in range(nElementsUp - 1 + nElementsExtra):
+        baseNodeIdentifier = 1 + n + er*nElementsAround
+        for ea in range(nElementsAround):
+            ea2 = (ea + 1) % nElementsAround
+            elementNodes.append([baseNodeIdentifier + ea, baseNodeIdentifier + ea2,
+                baseNodeIdentifier + nElementsAround + ea, baseNodeIdentifier + nElementsAround + ea2])
+    return elementNodes
+
+def _getedges(elementNodes):
+    """
+    :return: Sorted node pairs of all element edges, excluding collapsed apex edges.
+    """
+    edges = numpy.concatenate((elementNodes[:, [0, 1]], elementNodes[:, [2, 3]],
+        elementNodes[:, [0, 2]], elementNodes[:, [1, 3]]))
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    edges.sort(axis=1)
+    return edges
+
+@pytest.mark.parametrize('size', [ (6, 1, 1), (8, 2, 0), (12, 3, 1), (20, 5, 3), (64, 7, 4) ])
+def test_element_nodes_match_loops(size):
+    elementNodes, elementHeaders = gethemisphereelementnodes(*size)
+    assert elementNodes.tolist() == _getloopelementnodes(*size)
+
+def test_element_headers():
+    elementNodes, elementHeaders = gethemisphereelementnodes(12, 3, 1)
+    assert _getheaderruns(elementHeaders) == [ (HEADER_1, 1), (HEADER_NORMAL, 4), (HEADER_2, 1), (HEADER_3, 1),
+        (HEADER_REVERSE, 4), (HEADER_4, 1), (HEADER_NORMAL, 36) ]
+
+@pytest.mark.parametrize('size', [ (2000, 250, 250), (1000, 1000, 0) ])
+def test_topology_at_scale(size):
+    elementNodes, elementHeaders = gethemisphereelementnodes(*size)
+    config = { 'elements around': size[0], 'elements up': size[1], 'elements along stem': size[2] }
+    nNodes, nElements = _getnodeandelementcounts(config)
+    assert elementNodes.shape == (nElements, 4)
+    assert nElements >= 1000000
+    # every node is used
+    assert numpy.array_equal(numpy.unique(elementNodes), numpy.arange(1, nNodes + 1))
+    # no edge is shared by more than 2 elements
+    edges = _getedges(elementNodes)
+    uniqueEdges, counts = numpy.unique(edges[:, 0]*(nNodes + 1) + edges[:, 1], return_counts=True)
+    assert counts.max() == 2
+    # only the top ring is open
+    assert numpy.count_nonzero(counts == 1) == size[0]
+
+def test_node_count():
+    config = { 'elements around': 12, 'elements up': 3, 'elements along stem': 2 }
+    nodeParameters = gethemispherenodes(12, 3, 2)
+    assert nodeParameters.shape == (_getnodeandelementcounts(config)[0], 4, 3)
+    # all nodes on the unit hemisphere or cylinder
+    x = nodeParameters[:, 0]
+    radius = numpy.where(x[:, 2] > 1.0E-12, numpy.linalg.norm(x[:, :2], axis=1), numpy.linalg.norm(x, axis=1))
+    assert numpy.allclose(radius, 1.0)
+
+def _applytransforms(nodeParameters, transforms):
+    for transform in transforms:
+        nodeParameters = transform(nodeParameters)
+    return nodeParameters
+
+@pytest.mark.parametrize('size', [ (12, 3, 2), (12, 25, 2), (8, 41, 3) ])
+def test_config_transforms(size):
+    nElementsAround, nElementsUp, nElementsExtra = size
+    config = { 'elements around': nElementsAround, 'elements up': nElementsUp, 'elements along stem': nElementsExtra,
+        'radius': 2.0, 'stem length': 3.0 }
+    baseNodeParameters = gethemispherenodes(*size)
+    nodeParameters = _applytransforms(baseNodeParameters, getconfigtransforms(config))
+    firstStemNodeIndex = nElementsAround // 2 - 1 + nElementsUp*nElementsAround
+    # hemisphere including its equator ring is only scaled by radius, even where
+    # rounding gives the equator a small positive z
+    assert numpy.array_equal(nodeParameters[:firstStemNodeIndex], 2.0*baseNodeParameters[:firstStemNodeIndex])
+    # stem is stretched to the stem length
+    assert numpy.allclose(nodeParameters[-nElementsAround:, 0, 2], 3.0)
+    assert numpy.allclose(nodeParameters[firstStemNodeIndex:, 2, 2], 3.0/nElementsExtra)
+
+def test_config_transforms_defaults():
+    config = { 'elements around': 12, 'elements up': 3, 'elements along stem': 2 }
+    baseNodeParameters = gethemispherenodes(12, 3, 2)
+    nodeParameters = _applytransforms(baseNodeParameters, getconfigtransforms(config))
+    assert numpy.array_equal(nodeParameters[:41], baseNodeParameters[:41])
+    assert numpy.allclose(nodeParameters[-12:, 0, 2], 0.5)
+
+def _getsurface(s1, s2):
+    """
+    :return: Coordinates of a curved test surface at parameters s1, s2.
+    """
+    return numpy.stack((s1, s2, s1*s2 + s1*s1), axis=-1)
+
+def _getsurfacenodes(s1, s2):
+    """
+    :return: Node parameters array for the test surface at parameter arrays s1, s2.
+    """
+    zero = numpy.zeros_like(s1)
+    one = numpy.ones_like(s1)
+    return numpy.stack((_getsurface(s1, s2),
+        numpy.stack((one, zero, s2 + 2.0*s1), axis=-1),
+        numpy.stack((zero, one, s1), axis=-1),
+        numpy.stack((zero, zero, one), axis=-1)), axis=1)
+
+def _bend(x):
+    """
+    Nonlinear deformation with its jacobian and hessian.
+    """
+    n = len(x)
+    newX = numpy.stack((x[:, 0] + 0.3*x[:, 1]*x[:, 1], x[:, 1] + 0.5*x[:, 0]*x[:, 2], x[:, 2] + 0.2*x[:, 0]*x[:, 0]), axis=-1)
+    jacobian = numpy.tile(numpy.identity(3), (n, 1, 1))
+    jacobian[:, 0, 1] = 0.6*x[:, 1]
+    jacobian[:, 1, 0] = 0.5*x[:, 2]
+    jacobian[:, 1, 2] = 0.5*x[:, 0]
+    jacobian[:, 2, 0] = 0.4*x[:, 0]
+    hessian = numpy.zeros((n, 3, 3, 3))
+    hessian[:, 0, 1, 1] = 0.6
+    hessian[:, 1, 0, 2] = hessian[:, 1, 2, 0] = 0.5
+    hessian[:, 2, 0, 0] = 0.4
+    return newX, jacobian, hessian
+
+def test_deformnodes_hessian():
+    s1, s2 = numpy.meshgrid(numpy.linspace(-1.0, 1.0, 5), numpy.linspace(-0.5, 1.5, 4))
+    s1 = s1.ravel()
+    s2 = s2.ravel()
+    nodeParameters = deformnodes(_getsurfacenodes(s1, s2), _bend)
+    # compare derivatives of the deformed surface with central finite differences
+    h = 1.0E-4
+    def deformed(ds1, ds2):
+        return _bend(_getsurface(s1 + ds1, s2 + ds2))[0]
+    assert numpy.allclose(nodeParameters[:, 0], deformed(0.0, 0.0))
+    assert numpy.allclose(nodeParameters[:, 1], (deformed(h, 0.0) - deformed(-h, 0.0))/(2.0*h), atol=1.0E-7)
+    assert numpy.allclose(nodeParameters[:, 2], (deformed(0.0, h) - deformed(0.0, -h))/(2.0*h), atol=1.0E-7)
+    assert numpy.allclose(nodeParameters[:, 3],
+        (deformed(h, h) - deformed(h, -h) - deformed(-h, h) + deformed(-h, -h))/(4.0*h*h), atol=1.0E-6)
+    # without the hessian the cross derivative misses the second order term
+    withoutHessian = deformnodes(_getsurfacenodes(s1, s2), lambda x: _bend(x)[:2])
+    assert not numpy.allclose(withoutHessian[:, 3], nodeParameters[:, 3])
+
+def test_affinetransformnodes_offset():
+    baseNodeParameters = gethemispherenodes(12, 3, 1)
+    matrix = numpy.array([ [ 0.0, -2.0, 0.0 ], [ 1.0, 0.0, 0.0 ], [ 0.0, 0.0, 3.0 ] ])
+    offset = numpy.array([ 1.0, -2.0, 0.5 ])
+    nodeParameters = affinetransformnodes(baseNodeParameters, matrix, offset)
+    assert numpy.allclose(nodeParameters[:, 0], numpy.dot(baseNodeParameters[:, 0], matrix.T) + offset)
+    # derivatives are not offset
+    assert numpy.allclose(nodeParameters[:, 1:], numpy.einsum('ij,nvj->nvi', matrix, baseNodeParameters[:, 1:]))
+
+def _scaleinplace(nodeParameters):
+    nodeParameters *= 2.0
+    return nodeParameters
+
+def test_variant_node_parameters():
+    baseNodeParameters = gethemispherenodes(12, 3, 1)
+    original = baseNodeParameters.copy()
+    offset = functools.partial(affinetransformnodes, matrix=numpy.identity(3), offset=numpy.array([ 0.0, 0.0, 1.0 ]))
+    transformsList = [ [], [], [ _scaleinplace ], [ _scaleinplace ], [], [], [ _scaleinplace, offset ] ]
+    variants = list(getvariantnodeparameters(baseNodeParameters, transformsList))
+    # in place transforms do not change the base, so every variant is from the original
+    assert numpy.array_equal(baseNodeParameters, original)
+    assert variants[0] is None
+    assert variants[1] is None
+    assert numpy.array_equal(variants[2], 2.0*original)
+    assert numpy.array_equal(variants[3], 2.0*original)
+    assert variants[2] is not variants[3]
+    assert variants[4] is baseNodeParameters
+    assert variants[5] is None
+    expected = 2.0*original
+    expected[:, 0, 2] += 1.0
+    assert numpy.array_equal(variants[6], expected)
+
+@pytest.mark.parametrize('size', [ (6, 1, 1), (9, 1, 0), (12, 3, 1), (13, 3, 1), (7, 2, 2), (64, 7, 4) ])
+def test_estimate_counts_match_generator(size):
+    config = { 'elements around': size[0], 'elements up': size[1], 'elements along stem': size[2] }
+    estimate = estimatehemispheremodel(config)
+    elementNodes = gethemisphereelementnodes(*size)[0]
+    assert estimate['nodes'] == len(gethemispherenodes(*size))
+    assert estimate['elements'] == len(elementNodes)
+    # line count includes the 2 collapsed apex edges
+    edges = numpy.concatenate((elementNodes[:, [0, 1]], elementNodes[:, [2, 3]],
+        elementNodes[:, [0, 2]], elementNodes[:, [1, 3]]))
+    edges.sort(axis=1)
+    assert estimate['lines'] == len(numpy.unique(edges, axis=0))
+
+def test_estimate_odd_elements_around():
+    estimate = estimatehemispheremodel({ 'elements around': 13, 'elements up': 3, 'elements along stem': 1 })
+    assert estimate['elements'] == 51
+
+@pytest.mark.parametrize('size, keys', [
+    ((12, 3, 1), []),
+    ((6, 1, 0), []),
+    ((13, 3, 1), [ 'elements around' ]),
+    ((4, 3, 1), [ 'elements around' ]),
+    ((12, 0, 1), [ 'elements up' ]),
+    ((5, 0, -1), [ 'elements around', 'elements up', 'elements along stem' ]) ])
+def test_config_problems(size, keys):
+    config = { 'elements around': size[0], 'elements up': size[1], 'elements along stem': size[2] }
+    assert [ key for key, message in gethemisphereconfigproblems(config) ] == keys
+
+# EX file headers in the format written by Zinc region.write
+_ZINC_NODE_HEADER = """ Group name: hemisphere
+ #Fields=1
+ 1) coordinates, coordinate, rectangular cartesian, #Components=3
+   x.  Value index=1, #Derivatives=3 (d/ds1,d/ds2,d2/ds1ds2)
+   y.  Value index=5, #Derivatives=3 (d/ds1,d/ds2,d2/ds1ds2)
+   z.  Value index=9, #Derivatives=3 (d/ds1,d/ds2,d2/ds1ds2)
+"""
+_ZINC_LINE_HEADER = """ Shape. Dimension=1, line
+ #Scale factor sets=0
+ #Nodes=0
+ #Fields=0
+"""
+_ZINC_COMPONENT_HEADER = """   {0}. c.Hermite*c.Hermite, no modify, standard node based.
+   #Nodes=4
+   1. #Values=4
+     Value labels: value d/ds1 d/ds2 d2/ds1ds2
+     Scale factor indices: 0 0 0 0
+   2. #Values=4
+     Value labels: value d/ds1 d/ds2 d2/ds1ds2
+     Scale factor indices: 0 0 0 0
+   3. #Values=4
+     Value labels: value d/ds1 d/ds2 d2/ds1ds2
+     Scale factor indices: 0 0 0 0
+   4. #Values=4
+     Value labels: value d/ds1 d/ds2 d2/ds1ds2
+     Scale factor indices: 0 0 0 0
+"""
+_ZINC_ELEMENT_HEADER = """ Shape. Dimension=2, line*line
+ #Scale factor sets=0
+ #Nodes=4
+ #Fields=1
+ 1) coordinates, coordinate, rectangular cartesian, #Components=3
+""" + "".join(_ZINC_COMPONENT_HEADER.format(c) for c in 'xyz')
+
+_SMALL_CONFIG = { 'elements around': 6, 'elements up': 1, 'elements along stem': 1 }
+
+def _getzincbuffer(config):
+    """
+    :return: EX format string for the hemisphere model as written by Zinc,
+    with all 2D elements using the normal element field header.
+    """
+    nElementsAround = config['elements around']
+    nElementsUp = config['elements up']
+    nElementsExtra = config['elements along stem']
+    nodeParameters = gethemispherenodes(nElementsAround, nElementsUp, nElementsExtra)
+    elementNodes = gethemisphereelementnodes(nElementsAround, nElementsUp, nElementsExtra)[0]
+    text = [ _ZINC_NODE_HEADER ]
+    for nodeIdentifier, parameters in enumerate(nodeParameters.tolist(), 1):
+        text.append(" Node:            " + str(nodeIdentifier) + "\n")
+        for c in range(3):
+            text.append("  " + " ".join("%.15e" % (values[c]) for values in parameters) + "\n")
+    text.append(_ZINC_LINE_HEADER)
+    for lineIdentifier in range(1, 4):
+        text.append(" Element: 0 0 " + str(lineIdentifier) + "\n")
+    text.append(_ZINC_ELEMENT_HEADER)
+    for elementIdentifier, nodeIdentifiers in enumerate(elementNodes.tolist(), 1):
+        text.append(" Element:            " + str(elementIdentifier) + " 0 0\n   Nodes:\n  " +
+            " ".join(str(nodeIdentifier) for nodeIdentifier in nodeIdentifiers) + "\n")
+    return "".join(text)
+
+def test_write_exfile(tmp_path):
+    config = _SMALL_CONFIG
+    elementHeaders = gethemisphereelementnodes(6, 1, 1)[1]
+    filenameOut = str(tmp_path / 'hemisphere.exf')
+    writehemisphereexfile(filenameOut, _getzincbuffer(config), config, elementHeaders)
+    assert os.listdir(str(tmp_path)) == [ 'hemisphere.exf' ]
+    verifyhemispheremodel(filenameOut, config)
+    with open(filenameOut, 'r') as infile:
+        text = infile.read()
+    nScaleFactorElements = numpy.count_nonzero(elementHeaders != HEADER_NORMAL)
+    headerRuns = _getheaderruns(elementHeaders)
+    nScaleFactorRuns = len([ header for header, count in headerRuns if header != HEADER_NORMAL ])
+    assert text.count(" #Scale factor sets=1\n") == nScaleFactorRuns
+    assert text.count(" #Scale factor sets=0\n") == 1 + len(headerRuns) - nScaleFactorRuns
+    assert text.count("Scale factors:\n-1\n") == nScaleFactorElements
+    assert text.count(" Element: 0 0 ") == 3
+
+@pytest.mark.parametrize('swap', [ (HEADER_1, HEADER_3), (HEADER_2, HEADER_4), (HEADER_REVERSE, HEADER_1) ])
+def test_write_exfile_detects_header_variant(tmp_path, swap):
+    config = _SMALL_CONFIG
+    elementHeaders = gethemisphereelementnodes(6, 1, 1)[1]
+    swappedHeaders = elementHeaders.copy()
+    swappedHeaders[elementHeaders == swap[0]] = swap[1]
+    swappedHeaders[elementHeaders == swap[1]] = swap[0]
+    filenameOut = str(tmp_path / 'hemisphere.exf')
+    with pytest.raises(ValueError, match="field header variant"):
+        writehemisphereexfile(filenameOut, _getzincbuffer(config), config, swappedHeaders)
+    # no corrupt or partial file is left behind
+    assert os.listdir(str(tmp_path)) == []
+
+def test_write_exfile_keeps_previous_output_on_failure(tmp_path):
+    config = _SMALL_CONFIG
+    elementHeaders = gethemisphereelementnodes(6, 1, 1)[1]
+    filenameOut = str(tmp_path / 'hemisphere.exf')
+    writehemisphereexfile(filenameOut, _getzincbuffer(config), config, elementHeaders)
+    with open(filenameOut, 'r') as infile:
+        previousText = infile.read()
+    # buffer missing its last node
+    buffer = _getzincbuffer(config)
+    lastNodeLoc = buffer.rfind(" Node:")
+    buffer = buffer[:lastNodeLoc] + buffer[buffer.find(" Shape. Dimension=1", lastNodeLoc):]
+    with pytest.raises(ValueError, match="nodes, expected"):
+        writehemisphereexfile(filenameOut, buffer, config, elementHeaders)
+    assert os.listdir(str(tmp_path)) == [ 'hemisphere.exf' ]
+    with open(filenameOut, 'r') as infile:
+        assert infile.read() == previousText
+
+def _removerecord(text, record, nextRecord):
+    return text[:text.index(record)] + text[text.index(nextRecord):]
+
+def _insertbefore(text, record, insertText):
+    loc = text.index(record)
+    return text[:loc] + insertText + text[loc:]
+
+_CORRUPTIONS = {
+    'missing node': lambda text: _removerecord(text, " Node:            20\n", " Node:            21\n"),
+    'missing element': lambda text: _removerecord(text, " Element:            30 0 0", " Element:            31 0 0"),
+    'missing line': lambda text: _removerecord(text, " Element: 0 0 2\n", " Element: 0 0 3\n"),
+    'missing scale factors': lambda text: text.replace("Scale factors:\n-1\n", "", 1),
+    'extra scale factors': lambda text: _insertbefore(text, " Element:            41 0 0", "Scale factors:\n-1\n") }
+
+@pytest.mark.parametrize('blockSize', [ 50, 97, 300, 4096, 1 << 22 ])
+def test_verify_block_boundaries(tmp_path, monkeypatch, blockSize):
+    monkeypatch.setattr(hemispheremesh, 'VERIFY_BLOCK_SIZE', blockSize)
+    config = { 'elements around': 12, 'elements up': 3, 'elements along stem': 1 }
+    elementHeaders = gethemisphereelementnodes(12, 3, 1)[1]
+    filenameOut = str(tmp_path / 'hemisphere.exf')
+    writehemisphereexfile(filenameOut, _getzincbuffer(config), config, elementHeaders)
+    with open(filenameOut, 'r') as infile:
+        text = infile.read()
+    for name, corruption in _CORRUPTIONS.items():
+        with open(filenameOut, 'w') as outfile:
+            outfile.write(corruption(text))
+        with pytest.raises(ValueError):
+            verifyhemispheremodel(filenameOut, config)
@@ -0,0 +1,143 @@
+"""
+Tests of concurrent step execution through AsyncFileStepMixin with stand-in
+steps, whose stub writer sleeps in place of model generation, so they need no
+Zinc, PySide or MAP Client.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from asyncexecution import AsyncFileStepMixin
+from localworkflow import runsteps
+
+def _sleepwrite(filenameOut, config):
+    time.sleep(config['seconds'])
+    if config['fail']:
+        raise ValueError("Failed after " + str(config['seconds']) + " seconds")
+    with open(filenameOut, 'w') as outfile:
+        json.dump(config, outfile)
+
+class _StandInSyncStep(object):
+    """
+    Step with the execution interface of the workflow step mount point,
+    writing its output with _sleepwrite.
+    """
+
+    _writeFile = staticmethod(_sleepwrite)
+    _outputFilename = 'standin.json'
+
+    def __init__(self, location, identifier, seconds, fail=False):
+        self._location = location
+        self._config = { 'identifier': identifier, 'seconds': seconds, 'fail': fail }
+        self._portData0 = None
+        self.doneThread = None
+
+    def getIdentifier(self):
+        return self._config['identifier']
+
+    def registerDoneExecution(self, doneExecution):
+        self._doneExecutionCallback = doneExecution
+
+    def _doneExecution(self):
+        self.doneThread = threading.current_thread()
+        self._doneExecutionCallback()
+
+    def execute(self):
+        filenameOut = os.path.join(self._location, self.getIdentifier() + '.json')
+        self._writeFile(filenameOut, self._config)
+        self._portData0 = filenameOut
+        self._doneExecution()
+
+    def getPortData(self, index):
+        return self._portData0
+
+class _StandInStep(AsyncFileStepMixin, _StandInSyncStep):
+    """
+    Stand-in step using the same executeAsync() as CreateHemisphereModelStep.
+    """
+
+def _readoutput(step):
+    with open(step.getPortData(0), 'r') as infile:
+        return json.load(infile)
+
+def test_runsteps_overlap_and_completion_order(tmp_path):
+    location = str(tmp_path)
+    steps = [ _StandInStep(location, 'slow', 0.6), _StandInStep(location, 'fast', 0.2),
+        _StandInStep(location, 'medium', 0.4), _StandInSyncStep(location, 'sync', 0.1) ]
+    executor = ThreadPoolExecutor(max_workers=3)
+    startTime = time.time()
+    completed = runsteps(steps, executor)
+    elapsed = time.time() - startTime
+    executor.shutdown()
+    # asynchronous steps overlap each other and the synchronous step
+    assert elapsed < 0.9
+    assert [ step.getIdentifier() for step in completed ] == [ 'sync', 'fast', 'medium', 'slow' ]
+    for step in steps:
+        # done execution is always handled on the runner thread
+        assert step.doneThread is threading.current_thread()
+        assert _readoutput(step)['identifier'] == step.getIdentifier()
+    assert steps[0].getPortData(0) == os.path.join(location, 'slow_output', 'standin.json')
+
+def test_runsteps_raises_step_exception(tmp_path):
+    location = str(tmp_path)
+    steps = [ _StandInStep(location, 'good', 0.2), _StandInStep(location, 'bad', 0.1, fail=True) ]
+    executor = ThreadPoolExecutor(max_workers=2)
+    with pytest.raises(ValueError, match="Failed after"):
+        runsteps(steps, executor)
+    executor.shutdown()
+    # the other step still completes before the exception is raised
+    assert _readoutput(steps[0])['identifier'] == 'good'
+    assert steps[1].getPortData(0) is None
+
+def test_runsteps_sync_exception_waits_for_started_steps(tmp_path):
+    location = str(tmp_path)
+    steps = [ _StandInStep(location, 'async', 0.3), _StandInSyncStep(location, 'sync', 0.0, fail=True) ]
+    executor = ThreadPoolExecutor(max_workers=1)
+    with pytest.raises(ValueError, match="Failed after"):
+        runsteps(steps, executor)
+    executor.shutdown()
+    # the started step completed on the runner thread before its loop was closed
+    assert steps[0].doneThread is threading.current_thread()
+    assert _readoutput(steps[0])['identifier'] == 'async'
+
+class _RecordingDispatcher(object):
+    """
+    Dispatcher running functions on the thread calling run(), in place of the
+    step's queued Qt signal dispatcher.
+    """
+
+    def __init__(self):
+        self._calls = []
+        self._condition = threading.Condition()
+
+    def dispatch(self, function, *args):
+        with self._condition:
+            self._calls.append((function, args))
+            self._condition.notify()
+
+    def run(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self._calls, timeout=5.0)
+            function, args = self._calls.pop(0)
+        function(*args)
+
+def test_execute_async_defaults(tmp_path):
+    step = _StandInStep(str(tmp_path), 'default', 0.2)
+    step._dispatcher = _RecordingDispatcher()
+    completed = []
+    step.registerDoneExecution(lambda: completed.append(step))
+    # default own executor and the step's dispatcher
+    done = step.executeAsync()
+    # later config edits do not affect the running write
+    step._config['identifier'] = 'edited'
+    assert not done.done()
+    step._dispatcher.run()
+    assert completed == [ step ]
+    assert step.doneThread is threading.current_thread()
+    assert done.result() == os.path.join(str(tmp_path), 'default_output', 'standin.json')
+    assert step.getPortData(0) == done.result()
+    assert _readoutput(step)['identifier'] == 'default'